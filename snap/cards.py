@@ -1,10 +1,9 @@
 """
 This module contains data-structures for representing playing cards.
 """
-from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import List
+from typing import Iterable, List, Optional, Tuple
 import random
 
 
@@ -39,82 +38,185 @@ class CardSuit(Enum):
     DIAMOND = "♢"
 
 
-@dataclass
+# Map each card value/suit to its ordinal, used to store cards compactly as small integers.
+_VALUE_ORD = {value: i for i, value in enumerate(CardValue)}
+_SUIT_ORD = {suit: i for i, suit in enumerate(CardSuit)}
+_NUM_VALUES = len(_VALUE_ORD)
+_NUM_SUITS = len(_SUIT_ORD)
+
+
+def card_code(value: CardValue, suit: CardSuit) -> int:
+    """
+    Encode a card's value and suit as a single small integer (0-51), which fits in one byte.
+    Cards with the same value have consecutive codes, so code_value gives the value ordinal.
+    """
+    return _VALUE_ORD[value] * _NUM_SUITS + _SUIT_ORD[suit]
+
+
+def code_value(code: int) -> int:
+    """Return the value ordinal (0-12) of a card code from card_code."""
+    return code // _NUM_SUITS
+
+
+@dataclass(frozen=True)
 class Card:
     """
     Represents a single card, consisting of a suit and a value.
+    Cards are immutable, which lets the same Card object be shared between decks and stacks.
     """
 
     value: CardValue
     suit: CardSuit
+    # The ordinal of the value and the card's code, cached since they're needed far more often
+    # than cards are created. They're derived from value and suit so aren't compared.
+    value_ordinal: int = field(init=False, repr=False, compare=False)
+    code: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "value_ordinal", _VALUE_ORD[self.value])
+        object.__setattr__(self, "code", card_code(self.value, self.suit))
 
     def __repr__(self):
         return f"{self.value.value}{self.suit.value}"
 
 
+# One of each possible playing card, built once and shared by every CardStack.
+# The card with code c is at index c.
+_CARDS_BY_CODE = tuple(
+    Card(value=value, suit=suit) for value in CardValue for suit in CardSuit
+)
+# The codes of a full deck, in suit order and then value order.
+_FULL_DECK_CODES = bytes(
+    card_code(value, suit) for suit in CardSuit for value in CardValue
+)
+# Translation table from a card code to its value ordinal, for bytes.translate.
+_CODE_TO_VALUE = bytes(code_value(code) for code in range(256))
+
+
 class CardStack:
     """
     Represents a collection of cards in some order.
     This could be a full deck of cards, just a few, or an empty set.
+
+    The cards are stored as a byte array of card codes (see card_code) rather than a list of
+    Card objects. Card objects are only looked up when cards are taken out of the stack,
+    so the same Card object is shared between stacks.
     """
 
-    def __init__(self, cards: List[Card] = None):
-        self._cards = cards or []
+    def __init__(self, cards: Optional[Iterable[Card]] = None):
+        self._codes = bytearray(card.code for card in cards or ())
 
-    def pop(self) -> Card:
-        """Remove the top card and return it."""
-        return self._cards.pop()
+    @classmethod
+    def _from_codes(cls, codes: bytes):
+        """Create a CardStack directly from an array of card codes."""
+        stack = cls.__new__(cls)
+        stack._codes = bytearray(codes)
+        return stack
+
+    @classmethod
+    def from_interned(cls, *cards: Card):
+        """Create a CardStack from the given cards (bottom first), passed as separate arguments."""
+        return cls(cards)
 
-    def peek(self) -> Card:
-        """Show the top card."""
-        if not self._cards:
+    def pop(self) -> Card:
+        """
+        Remove the top card and return it.
+        Like all cards taken out of a stack, this is the shared Card object for its value and suit,
+        not necessarily the object that was pushed. Compare cards with == rather than is.
+        """
+        return _CARDS_BY_CODE[self._codes.pop()]
+
+    def peek(self) -> Optional[Card]:
+        """Show the top card (a shared Card object, as for pop)."""
+        if not self._codes:
             return None
-        return self._cards[-1]
+        return _CARDS_BY_CODE[self._codes[-1]]
 
     def push(self, card: Card):
         """Add a card to the top of the stack."""
-        self._cards.append(card)
+        self._codes.append(card.code)
+
+    def clear(self):
+        """Remove all the cards."""
+        self._codes.clear()
+
+    def deal(self, num_stacks: int) -> List["CardStack"]:
+        """
+        Deal the cards out one at a time into the given number of new stacks, like a dealer would.
+        This stack is left unchanged.
+        """
+        return [
+            CardStack._from_codes(self._codes[i::num_stacks]) for i in range(num_stacks)
+        ]
 
     def shuffle(self):
         """Randomly shuffle all the cards."""
-        random.shuffle(self._cards)
+        random.shuffle(self._codes)
+
+    def value_ordinals(self) -> bytes:
+        """Return the ordinals (0-12) of the card values, from bottom to top."""
+        return bytes(self._codes.translate(_CODE_TO_VALUE))
+
+    @property
+    def size(self) -> int:
+        """The number of cards in the stack (the same as len, which is already O(1))."""
+        return len(self._codes)
 
     def __repr__(self):
-        return f"<CardStack {str(self._cards)}>"
+        return f"<CardStack {str(list(self))}>"
 
     def __add__(self, other_stack):
         """This way we can easily merge two stacks using the standard addition operator."""
-        return CardStack(self._cards + other_stack._cards)
+        return CardStack._from_codes(self._codes + other_stack._codes)
+
+    def __iadd__(self, other_stack):
+        """Add the cards from another stack to the top of this one, in place."""
+        self._codes += other_stack._codes
+        return self
 
     def __iter__(self):
-        return iter(self._cards)
+        """Iterate over the cards from bottom to top, as shared Card objects (see pop)."""
+        return map(_CARDS_BY_CODE.__getitem__, self._codes)
 
     def __len__(self):
-        return len(self._cards)
+        return len(self._codes)
 
     @staticmethod
-    def new_full_deck():
-        """Create a CardStack containing one of each possible playing card."""
-        return CardStack(
-            [Card(value=value, suit=suit) for suit in CardSuit for value in CardValue]
-        )
+    def new_full_deck(num_decks: int = 1):
+        """Create a CardStack containing one of each possible playing card per deck."""
+        return CardStack._from_codes(_FULL_DECK_CODES * num_decks)
 
 
-def find_pair(player_cards: dict[int, Card]) -> List[int]:
+def find_pair(cards: Iterable[Card]) -> Optional[Tuple[int, int]]:
     """
-    Checks whether the cards for the given players contain a pair.
-    Takes a dict mapping player ID to card.
-    If a pair was found, returns the 2 player IDs who have matching cards.
+    Checks whether the given cards contain a pair.
+    Takes any iterable of cards, such as a list, tuple or CardStack.
+    If a pair was found, returns the positions of the first 2 cards with matching values.
     If no pair was found, returns None.
     """
-    # maps card value to player id
-    value_to_player_id = defaultdict(list)
-
-    for i, card in player_cards.items():
-        value_to_player_id[card.value].append(i)
-
-    for _, pids in value_to_player_id.items():
-        if len(pids) > 1:  # At least two cards have the same value.
-            return pids[:2]  # Only return the first pair found.
+    if isinstance(cards, (tuple, list)) and len(cards) == 2:
+        # Exactly two cards form a pair only if their values match,
+        # so this is answered with a single comparison instead of the general scan.
+        return (0, 1) if cards[0].value is cards[1].value else None
+    if isinstance(cards, CardStack):
+        # A CardStack already stores its values as ordinals, so scan those without
+        # creating the Card objects.
+        return find_value_pair(cards.value_ordinals())
+    return find_value_pair(card.value_ordinal for card in cards)
+
+
+def find_value_pair(value_ordinals: Iterable[int]) -> Optional[Tuple[int, int]]:
+    """
+    Like find_pair, but takes the ordinals (0-12) of the card values rather than the cards.
+    This lets callers that already store cards as integers skip building Card objects.
+    """
+    # Maps a value's ordinal to the position of the first card seen with that value (or -1).
+    first_index = [-1] * _NUM_VALUES
+
+    for i, ordinal in enumerate(value_ordinals):
+        previous_index = first_index[ordinal]
+        if previous_index >= 0:  # At least two cards have the same value.
+            return previous_index, i  # Only return the first pair found.
+        first_index[ordinal] = i
 
     return None
@@ -45,12 +45,13 @@ def main():
         "Simulating snap with %d deck(s) and %d players.", args.decks, args.players
     )
 
-    config = SnapGameConfig()
-    config.num_decks = args.decks
-    config.num_players = args.players
-    config.turn_delay = args.turn_delay
-    config.fast_ai = args.fast_ai
-    config.use_human_player = args.human_player
+    config = SnapGameConfig(
+        num_decks=args.decks,
+        num_players=args.players,
+        turn_delay=args.turn_delay,
+        fast_ai=args.fast_ai,
+        use_human_player=args.human_player,
+    )
 
     SnapSimulator().run(config)
 
@@ -3,25 +3,36 @@ Code for players of Snap, as well as the messages that can be sent between playe
 and the game server.
 
 Each player runs in a different thread. These threads communicate with the main thread
-by reading/writing messages on thread-safe queues.
+through a couple of objects shared between all players.
 
-Players send PlayerMessage instances to the server via the snap_queue. This queue
-is shared between all players and helps to determine who called snap first.
+Players send PlayerMessage instances to the server via the snap_arbiter. The arbiter
+is shared between all players and keeps only the first SNAP of each turn, so the server
+can tell who called snap first without waiting for a message from every player.
 
-The server sends ServerMessage instances to each player via that player's turn_queue.
+The server sends ServerMessage instances to every player at once via the turn_broadcast.
 A TURN message tells the player about the current face-up cards for example.
-A GAME_OVER message tells the player that the game is over and allows the thread to finish.
+An END_GAME message tells the player that the game is over and allows the thread to finish.
+When a player is knocked out, the server clears their still_in_game flag instead.
 """
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum
-from queue import SimpleQueue, Queue, Empty, Full
+from queue import Queue, Empty, Full
+from typing import Optional, Sequence, Tuple
 import threading
 import time
 import random
 import logging
 
-from snap.cards import CardStack, find_pair
+from snap.cards import Card, find_pair
+
+# Reaction times at or below this (in seconds) are treated as instant, skipping the sleep.
+INSTANT_REACTION_TIME = 0.001
+
+# How long (in seconds) a human player has to press Enter on each turn,
+# and how often they check whether the turn has already been decided without them.
+HUMAN_REACTION_TIME_LIMIT = 3.0
+HUMAN_POLL_INTERVAL = 0.05
 
 
 class PlayerMessageType(Enum):
@@ -39,11 +50,10 @@ class ServerMessageType(Enum):
     """
 
     TURN = "TURN"
-    PLAYER_OUT = "PLAYER_OUT"
     END_GAME = "END_GAME"
 
 
-@dataclass
+@dataclass(frozen=True)
 class PlayerMessage:
     """
     A message sent from players to the game server.
@@ -53,14 +63,116 @@ class PlayerMessage:
     message_type: PlayerMessageType
 
 
-@dataclass
+@dataclass(frozen=True)
 class ServerMessage:
     """
     A message sent from the game server to players.
     """
 
     message_type: ServerMessageType
-    cards: CardStack = None
+    cards: Optional[Sequence[Card]] = None
+    turn_number: Optional[int] = None
+
+
+# The END_GAME message carries no other data, so a single instance is shared.
+END_GAME_MESSAGE = ServerMessage(message_type=ServerMessageType.END_GAME)
+
+
+class SnapArbiter:
+    """
+    Decides which player called SNAP first on each turn.
+
+    Every player still in the game responds once per turn. Only the first SNAP is kept,
+    while NO_SNAP responses just count towards the number of responses received.
+    The server stops waiting as soon as someone says SNAP, so responses are tagged with
+    the turn they're for, and late responses to an earlier turn are ignored.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._turn_number: Optional[int] = None
+        self._num_responses_expected = 0
+        self._first_snap: Optional[PlayerMessage] = None
+
+    def open_turn(self, turn_number: int, num_responses: int):
+        """
+        Start accepting the given number of responses for a turn.
+        Call this before announcing the turn to the players.
+        """
+        with self._condition:
+            self._turn_number = turn_number
+            self._num_responses_expected = num_responses
+            self._first_snap = None
+
+    def respond(self, turn_number: int, message: PlayerMessage):
+        """Record a player's response for the given turn."""
+        with self._condition:
+            if turn_number != self._turn_number:
+                return  # The server has already stopped waiting for this turn.
+            self._num_responses_expected -= 1
+            if (
+                message.message_type == PlayerMessageType.SNAP
+                and self._first_snap is None
+            ):
+                self._first_snap = message
+            if self._is_turn_decided():
+                self._condition.notify()
+
+    def gather(self) -> Optional[PlayerMessage]:
+        """
+        Block until someone says SNAP or everyone has responded,
+        then stop accepting responses for the current turn.
+        Returns the first SNAP message, or None if nobody called snap.
+        """
+        with self._condition:
+            self._condition.wait_for(self._is_turn_decided)
+            self._turn_number = None
+            return self._first_snap
+
+    @property
+    def turn_number(self) -> Optional[int]:
+        """The turn currently accepting responses, or None if the server isn't waiting."""
+        return self._turn_number
+
+    def _is_turn_decided(self) -> bool:
+        return self._first_snap is not None or self._num_responses_expected <= 0
+
+
+class TurnBroadcast:
+    """
+    Publishes messages from the server to all players at once.
+
+    The latest message is kept in a single shared slot along with a turn number.
+    Players wait on a condition variable until the turn number changes, so the server
+    only has to write each message once however many players there are.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._turn_number = 0
+        self._message: Optional[ServerMessage] = None
+
+    def publish(self, message: ServerMessage):
+        """Replace the current message and wake up every waiting player."""
+        with self._condition:
+            self._message = message
+            self._turn_number += 1
+            self._condition.notify_all()
+
+    def wait(
+        self, last_turn_number: int, player: "Player"
+    ) -> Tuple[int, Optional[ServerMessage]]:
+        """
+        Block until a message newer than last_turn_number is published,
+        or until the given player is out of the game.
+        Returns the new turn number and message.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._turn_number != last_turn_number
+                or not player.still_in_game
+            )
+            return self._turn_number, self._message
 
 
 class Player(ABC):
@@ -68,21 +180,39 @@ class Player(ABC):
     Represents an abstract player of Snap.
 
     Each player runs in a different thread and communicates with the main thread that runs
-    the game by reading/writing messages on a queue.
+    the game through the shared turn_broadcast and snap_arbiter.
     """
 
-    def __init__(self, player_id: int, snap_queue: SimpleQueue):
+    # Subclasses which add no attributes of their own can set __slots__ = () to drop the __dict__.
+    __slots__ = (
+        "player_id",
+        "turn_broadcast",
+        "snap_arbiter",
+        "still_in_game",
+        "thread",
+    )
+
+    # Set to True or False by subclasses which always make the same decision, so that decide()
+    # can skip calling should_call_snap. None means should_call_snap is asked every turn.
+    SNAP_POLICY: Optional[bool] = None
+
+    def __init__(
+        self,
+        player_id: int,
+        snap_arbiter: SnapArbiter,
+        turn_broadcast: TurnBroadcast,
+    ):
         # The player ID
         self.player_id = player_id
 
-        # A queue that the main thread will use to inform this player about new cards on each turn.
-        self.turn_queue = SimpleQueue()
+        # Used by the main thread to inform all players about new cards on each turn.
+        self.turn_broadcast = turn_broadcast
 
-        # A queue that this player will use to alert the dealer if she wants to say "snap".
-        # This queue is shared by all players, providing the order of who called "snap" first.
-        self.snap_queue = snap_queue
+        # Used by this player to tell the dealer whether she wants to say "snap".
+        # This is shared by all players, providing the order of who called "snap" first.
+        self.snap_arbiter = snap_arbiter
 
-        # Changed to false when the player is out of the game.
+        # Changed to false when the player is out of the game (by the server or at the end).
         self.still_in_game = True
 
         # The thread that will run the game loop for this player.
@@ -93,37 +223,51 @@ class Player(ABC):
         The game loop for this player, which will be the target of a threading.Thread instance.
         """
         logging.debug("Running")
+        # This player's responses are the same every turn, so create them once up front.
+        snap_message = PlayerMessage(
+            player_id=self.player_id, message_type=PlayerMessageType.SNAP
+        )
+        no_snap_message = PlayerMessage(
+            player_id=self.player_id, message_type=PlayerMessageType.NO_SNAP
+        )
+        # Look up the methods used on every turn once, rather than on each pass of the loop.
+        wait_for_turn = self.turn_broadcast.wait
+        respond = self.snap_arbiter.respond
+        decide = self.decide
+
+        turn_number = 0
         while True:
             # logging.debug("Waiting for turn")
-            server_message = self.turn_queue.get(block=True)
-            if server_message.message_type == ServerMessageType.END_GAME:
-                self.still_in_game = False
+            turn_number, server_message = wait_for_turn(turn_number, self)
+            if not self.still_in_game:
+                # The game is still ongoing but this player is out
                 break
 
-            if server_message.message_type == ServerMessageType.PLAYER_OUT:
-                # The game is still ongoing but this player is out
+            message_type = server_message.message_type
+            if message_type is ServerMessageType.END_GAME:
                 self.still_in_game = False
                 break
 
-            if server_message.message_type != ServerMessageType.TURN:
+            if message_type is not ServerMessageType.TURN:
                 logging.error("Unexpected message: %s", server_message)
                 break
 
-            cards = server_message.cards
-            if self.should_call_snap(cards):
+            if decide(server_message.cards):
                 # logging.debug("Calling snap")
-                self.snap_queue.put_nowait(
-                    PlayerMessage(
-                        player_id=self.player_id, message_type=PlayerMessageType.SNAP
-                    )
-                )
+                respond(server_message.turn_number, snap_message)
             else:
                 # logging.debug("Not calling snap")
-                self.snap_queue.put_nowait(
-                    PlayerMessage(
-                        player_id=self.player_id, message_type=PlayerMessageType.NO_SNAP
-                    )
-                )
+                respond(server_message.turn_number, no_snap_message)
+
+    def decide(self, cards) -> bool:
+        """
+        Return whether or not to say SNAP, using SNAP_POLICY if it's set.
+        Used both by run() and by the simulator when it asks players directly.
+        """
+        snap_policy = self.SNAP_POLICY
+        if snap_policy is not None:
+            return snap_policy
+        return self.should_call_snap(cards)
 
     @abstractmethod
     def should_call_snap(self, cards) -> bool:
@@ -137,33 +281,44 @@ class ComputerPlayer(Player):
     It has a random reaction time.
     """
 
-    def __init__(self, player_id: int, snap_queue: SimpleQueue):
-        super().__init__(player_id, snap_queue)
-        self.mistake_chance = random.uniform(
+    def __init__(
+        self,
+        player_id: int,
+        snap_arbiter: SnapArbiter,
+        turn_broadcast: TurnBroadcast,
+    ):
+        super().__init__(player_id, snap_arbiter, turn_broadcast)
+        # Each AI has its own random number generator rather than sharing the module's one.
+        self.rng = random.Random()
+        self.mistake_chance = self.rng.uniform(
             0.01, 0.04
         )  # the chance the AI will incorrectly call snap
-        self.miss_chance = random.uniform(
+        self.miss_chance = self.rng.uniform(
             0.05, 0.2
         )  # the chance the AI will miss a snap
-        self.reaction_time_min = random.uniform(
+        self.reaction_time_min = self.rng.uniform(
             0.4, 0.6
         )  # the minimum reaction time of this AI
-        self.reaction_time_max = random.uniform(
+        self.reaction_time_max = self.rng.uniform(
             1.0, 2.5
         )  # the maximum reaction time of this AI
 
-    def should_call_snap(self, cards: CardStack) -> bool:
+    def should_call_snap(self, cards: Sequence[Card]) -> bool:
         """Return whether or not to say SNAP."""
-        reaction_time = random.uniform(self.reaction_time_min, self.reaction_time_max)
-        time.sleep(reaction_time)
-
-        if find_pair(dict(enumerate(cards))):
-            if random.random() < self.miss_chance:
+        # Don't yield to the OS scheduler at all when the AI is meant to react instantly.
+        if self.reaction_time_max > INSTANT_REACTION_TIME:
+            reaction_time = self.rng.uniform(
+                self.reaction_time_min, self.reaction_time_max
+            )
+            time.sleep(reaction_time)
+
+        if find_pair(cards):
+            if self.rng.random() < self.miss_chance:
                 # We missed it
                 return False
             return True
 
-        return random.random() < self.mistake_chance  # incorrectly call snap
+        return self.rng.random() < self.mistake_chance  # incorrectly call snap
 
 
 class HumanPlayer(Player):
@@ -172,8 +327,13 @@ class HumanPlayer(Player):
     Press Enter to indicate when you want to say SNAP.
     """
 
-    def __init__(self, player_id: int, snap_queue: SimpleQueue):
-        super().__init__(player_id, snap_queue)
+    def __init__(
+        self,
+        player_id: int,
+        snap_arbiter: SnapArbiter,
+        turn_broadcast: TurnBroadcast,
+    ):
+        super().__init__(player_id, snap_arbiter, turn_broadcast)
 
         print(
             "You've chosen to play as a human!. You'll be player 0. Hit Enter when you see a snap."
@@ -206,7 +366,25 @@ class HumanPlayer(Player):
 
     def should_call_snap(self, cards) -> bool:
         """Return whether or not to say SNAP."""
-        try:
-            return self.should_snap_queue.get(timeout=3)
-        except Empty:
+        # Stop waiting as soon as the server stops accepting responses for this turn
+        # (e.g. because another player called snap), so that an Enter pressed for the next
+        # turn isn't used up by this one.
+        turn_number = self.snap_arbiter.turn_number
+        deadline = time.monotonic() + HUMAN_REACTION_TIME_LIMIT
+        while turn_number is not None and self.snap_arbiter.turn_number == turn_number:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                self.should_snap_queue.get(timeout=min(remaining, HUMAN_POLL_INTERVAL))
+            except Empty:
+                continue
+            if self.snap_arbiter.turn_number == turn_number:
+                return True
+            # The turn closed just as Enter was pressed, so keep the press for the next turn.
+            try:
+                self.should_snap_queue.put_nowait(True)
+            except Full:
+                pass
             return False
+        return False
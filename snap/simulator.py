@@ -1,12 +1,11 @@
 """
 Simulator for the game of Snap.
 """
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import logging
 import time
 import threading
 import random
-from queue import SimpleQueue
 from dataclasses import dataclass
 
 from snap.cards import Card, CardStack, find_pair
@@ -16,12 +15,16 @@ from snap.player import (
     PlayerMessageType,
     HumanPlayer,
     ComputerPlayer,
+    END_GAME_MESSAGE,
+    INSTANT_REACTION_TIME,
     ServerMessageType,
     ServerMessage,
+    SnapArbiter,
+    TurnBroadcast,
 )
 
 
-@dataclass
+@dataclass(frozen=True)
 class SnapGameConfig:
     """
     Configuration for the game of Snap.
@@ -34,7 +37,7 @@ class SnapGameConfig:
     use_human_player: bool = False
 
 
-class SnapSimulator:
+class SnapSimulator:  # pylint: disable=too-many-instance-attributes
     """
     Simulator for the game of Snap.
     The entrypoint is the 'run' method, which blocks until the game completes.
@@ -43,12 +46,31 @@ class SnapSimulator:
     def __init__(self):
         self.turn_count = 0
         self.config = SnapGameConfig()
-        self.players: Player = []
-        self.snap_queue = SimpleQueue()
+        # The indices in self.players of the players still in the game, and those players.
+        # Kept up to date by the players setter and mark_player_out, which are rare,
+        # so that the lookups made on every turn are just indexing.
+        self._player_indices_still_in: Tuple[int, ...] = ()
+        self._players_still_in: Tuple[Player, ...] = ()
+        self.players: List[Player] = []
+        # Created afresh for each game by start_game, so there's nothing to build until then.
+        self.snap_arbiter: Optional[SnapArbiter] = None
+        self.turn_broadcast: Optional[TurnBroadcast] = None
+        # If set, the players are asked for their responses directly rather than in threads.
+        self.run_players_inline = False
         self.cards_drawn: List[Tuple[int, Card]] = []
         self.player_card_up_piles: List[CardStack] = []
         self.player_card_down_piles: List[CardStack] = []
 
+    @property
+    def players(self) -> List[Player]:
+        """The players of the game, in order of player ID."""
+        return self._players
+
+    @players.setter
+    def players(self, players: List[Player]):
+        self._players = players
+        self._update_players_still_in_game()
+
     def run(self, config: SnapGameConfig):
         """
         Run the main game loop until the game completes.
@@ -71,12 +93,15 @@ class SnapSimulator:
         The game ends in a win if only one player has cards left in his down pile.
         The game ends in a draw if no players have cards left in their down piles.
         """
-        non_empty_down_piles = [
-            stack for stack in self.player_card_down_piles if len(stack)
-        ]
-        return len(non_empty_down_piles) <= 1
+        players_with_cards = 0
+        for stack in self.player_card_down_piles:
+            if stack:
+                players_with_cards += 1
+                if players_with_cards > 1:  # No need to look at the rest of the piles.
+                    return False
+        return True
 
-    def get_winning_player_index(self) -> int:
+    def get_winning_player_index(self) -> Optional[int]:
         """
         Return the index of the player who has won the game.
         Returns None if it's a draw.
@@ -108,28 +133,30 @@ class SnapSimulator:
         The players will then be given the opportunity to say SNAP.
         If someone correctly called snap then cards will be updated.
         """
-        cards = self.turn_over_new_card()
-        responses = self.gather_responses(cards)
-        self.process_responses(cards, responses)
+        player_ids, cards = self.turn_over_new_card()
+        first_snap = self.gather_responses(cards)
+        self.process_responses(player_ids, cards, first_snap)
         self.mark_players_out()
         self.turn_count += 1
         print()  # make the output a little easier to read
-        time.sleep(self.config.turn_delay)
+        # Even time.sleep(0) costs a system call, so skip it when there's no delay.
+        if self.config.turn_delay > 0:
+            time.sleep(self.config.turn_delay)
 
     def get_player_id_to_play_next(self) -> int:
         """
         Return the ID of the player whose turn it is to play next.
         """
-        players_still_in = self.players_still_in_game()
-        player_to_play_next = players_still_in[self.turn_count % len(players_still_in)]
-        return player_to_play_next.player_id
+        indices_still_in = self._player_indices_still_in
+        player_index = indices_still_in[self.turn_count % len(indices_still_in)]
+        return self.players[player_index].player_id
 
-    def turn_over_new_card(self) -> dict[int, Card]:
+    def turn_over_new_card(self) -> Tuple[Tuple[int, ...], Tuple[Card, ...]]:
         """
         Turn over a new card from one player's down pile on their turn.
-        Returns this card plus the previous card that was turned over (if any)
-        in the form of a dict mapping player ID to card.
-        Excludes the players who are out of the game.
+        Returns this card plus the previous card that was turned over (if any, and if it was
+        drawn by a different player), as a tuple of the IDs of the players who drew them
+        and a tuple of the cards in the same order.
         Prints a message informing the user about all top cards from each player.
         """
         next_player_id = self.get_player_id_to_play_next()
@@ -140,7 +167,12 @@ class SnapSimulator:
         # Record the card drawn (communicate this to each player later)
         self.cards_drawn.append((next_player_id, card))
         self.print_turn_info_message()
-        return dict(self.cards_drawn[-2:])
+        if len(self.cards_drawn) > 1:
+            previous_player_id, previous_card = self.cards_drawn[-2]
+            # A player can draw twice in a row after others go out, but can't pair with themself.
+            if previous_player_id != next_player_id:
+                return (previous_player_id, next_player_id), (previous_card, card)
+        return (next_player_id,), (card,)
 
     def print_turn_info_message(self):
         """
@@ -159,65 +191,107 @@ class SnapSimulator:
             )
         )
 
-    def gather_responses(self, cards: dict[int, Card]) -> List[PlayerMessage]:
+    def gather_responses(self, cards: Tuple[Card, ...]) -> Optional[PlayerMessage]:
         """
         Given some new cards, gather responses from each player about whether
         they want to say snap or not.
+        Returns the message from the first player to say snap, or None if nobody did.
         """
-        # Communicate the newly drawn cards to each player.
-        responses = []
-        for player in self.players:
-            player.turn_queue.put_nowait(
-                ServerMessage(message_type=ServerMessageType.TURN, cards=cards.values())
+        if self.run_players_inline:
+            first_snap = self._gather_responses_inline(cards)
+        else:
+            first_snap = self._gather_responses_threaded(cards)
+
+        if first_snap is not None:
+            print(f"Player {first_snap.player_id}: SNAP!")
+
+        return first_snap
+
+    def _gather_responses_threaded(
+        self, cards: Tuple[Card, ...]
+    ) -> Optional[PlayerMessage]:
+        """
+        Gather responses from the player threads, returning the first SNAP (if any).
+        """
+        # Expect a response from every player still in the game before telling them about the turn.
+        self.snap_arbiter.open_turn(self.turn_count, self.num_players_still_in_game())
+        # Communicate the newly drawn cards to every player at once.
+        self.turn_broadcast.publish(
+            ServerMessage(
+                message_type=ServerMessageType.TURN,
+                cards=cards,
+                turn_number=self.turn_count,
             )
+        )
+
+        # Wait for the first SNAP, or for all players still in the game to say NO_SNAP.
+        return self.snap_arbiter.gather()
 
-        # Wait for a response from all players still in the game (SNAP or NO_SNAP)
-        while len(responses) < len(self.players_still_in_game()):
-            response = self.snap_queue.get(block=True)
-            if response.message_type == PlayerMessageType.SNAP:
-                print(f"Player {response.player_id}: SNAP!")
-            responses.append(response)
+    def _gather_responses_inline(
+        self, cards: Tuple[Card, ...]
+    ) -> Optional[PlayerMessage]:
+        """
+        Ask each player directly whether they want to say snap, returning the first SNAP (if any).
+        This avoids the cost of switching between threads when the AI plays instantly.
+        """
+        players_still_in = self.players_still_in_game()
+        # Ask in a random order, since nobody has a head start when reacting instantly.
+        for player in random.sample(players_still_in, len(players_still_in)):
+            if player.decide(cards):
+                return PlayerMessage(
+                    player_id=player.player_id, message_type=PlayerMessageType.SNAP
+                )
 
-        return responses
+        return None
 
-    def process_responses(self, cards: CardStack, responses: List[PlayerMessage]):
+    def process_responses(
+        self,
+        player_ids: Tuple[int, ...],
+        cards: Tuple[Card, ...],
+        first_snap: Optional[PlayerMessage],
+    ):
         """
         Process the responses from each player about whether they want to say snap or not.
         Here we decide whether anyone won the turn.
         """
-        for message in responses:
-            if message.message_type == PlayerMessageType.SNAP:
-                self.resolve_snap_decision(cards, message.player_id)
-                break  # Only the first player to call snap matters
+        if first_snap is not None:  # Only the first player to call snap matters
+            self.resolve_snap_decision(player_ids, cards, first_snap.player_id)
 
-    def resolve_snap_decision(self, cards: dict[int, Card], player_id: int):
+    def resolve_snap_decision(
+        self, player_ids: Tuple[int, ...], cards: Tuple[Card, ...], player_id: int
+    ):
         """
         Resolve the outcome of a player saying snap.
+        player_ids holds the ID of the player who drew each of the cards, in the same order.
         Either they were correct and they win some cards, or they were incorrect and they lose one.
         """
-        if snap_indices := find_pair(cards):
+        if snap_positions := find_pair(cards):
+            # Map the positions of the matching cards back to the IDs of the players who drew them.
+            snap_indices = (
+                player_ids[snap_positions[0]],
+                player_ids[snap_positions[1]],
+            )
             self.resolve_snap_decision_correct(snap_indices, player_id)
         else:
             self.resolve_snap_decision_incorrect(player_id)
 
-    def resolve_snap_decision_correct(self, snap_indices: List[int], player_id: int):
+    def resolve_snap_decision_correct(
+        self, snap_indices: Tuple[int, int], player_id: int
+    ):
         """
         Resolve a correct snap decision.
         """
-        victory_cards = (
-            self.player_card_up_piles[snap_indices[0]]
-            + self.player_card_up_piles[snap_indices[1]]
-        )
+        snapped_up_piles = [self.player_card_up_piles[i] for i in snap_indices]
+        num_victory_cards = sum(len(pile) for pile in snapped_up_piles)
         print(
-            f"Player {player_id} called snap correctly and won {len(victory_cards)} cards."
+            f"Player {player_id} called snap correctly and won {num_victory_cards} cards."
         )
 
-        # Clear the card up piles for the players with snapped cards.
-        self.player_card_up_piles[snap_indices[0]] = CardStack()
-        self.player_card_up_piles[snap_indices[1]] = CardStack()
-
-        # Give the victory cards to the player who called snap.
-        self.player_card_down_piles[player_id] += victory_cards
+        for pile in snapped_up_piles:
+            # Give the victory cards to the player who called snap.
+            self.player_card_down_piles[player_id] += pile
+            # Clear the card up piles for the players with snapped cards.
+            pile.clear()
 
         # Reset the 'cards_drawn' list since we're starting a new hand.
         self.cards_drawn = []
@@ -228,14 +302,19 @@ class SnapSimulator:
         Remove one card from the mistaken player's down pile (if any) and give it to a random
         other player.
         """
+        indices_still_in = self._player_indices_still_in
         if not self.player_card_down_piles[player_id]:
             # Their down pile is empty
             return
+        if indices_still_in == (player_id,):
+            # There's nobody else to give the card to
+            return
         card = self.player_card_down_piles[player_id].pop()
-        other_players_still_in = set(
-            player.player_id for player in self.players_still_in_game()
-        ) - set([player_id])
-        player_to_receive_card = random.choice(list(other_players_still_in))
+        # Pick from the cached tuple until we get someone else, rather than building a list
+        # of the other players. With at least two players still in, this rarely repeats.
+        player_to_receive_card = player_id
+        while player_to_receive_card == player_id:
+            player_to_receive_card = random.choice(indices_still_in)
         self.player_card_down_piles[player_to_receive_card].push(card)
         print(
             f"Player {player_id} called snap incorrectly and "
@@ -246,44 +325,68 @@ class SnapSimulator:
         """
         Mark players as out if they have run out of cards in their down pile.
         """
-        for down_pile, player in zip(self.player_card_down_piles, self.players):
+        for i, (down_pile, player) in enumerate(
+            zip(self.player_card_down_piles, self.players)
+        ):
             if player.still_in_game and not down_pile:
                 print(f"Player {player.player_id} is out!")
-                player.turn_queue.put_nowait(
-                    ServerMessage(message_type=ServerMessageType.PLAYER_OUT)
-                )
+                self.mark_player_out(i)
+
+    def mark_player_out(self, player_index: int):
+        """
+        Mark the player at the given index in self.players as out of the game.
+        """
+        # Their thread will notice this and finish when the next message is published.
+        # Marking them out here also stops the next turn waiting for their response.
+        self.players[player_index].still_in_game = False
+        self._update_players_still_in_game()
+
+    def _update_players_still_in_game(self):
+        """
+        Rebuild the cached indices and players of those still in the game from self.players.
+        """
+        self._player_indices_still_in = tuple(
+            i for i, player in enumerate(self._players) if player.still_in_game
+        )
+        self._players_still_in = tuple(
+            self._players[i] for i in self._player_indices_still_in
+        )
 
     def start_game(self):
         """
         Set up the initial state of the game.
         This includes creating and shuffling the deck(s) used as well as creating
         threads for each player worker.
+        When only fast AI players are playing, they are run inline instead of in threads.
         """
         self.turn_count = 1
-        self.players = []
-        self.snap_queue = SimpleQueue()
+        self.snap_arbiter = SnapArbiter()
+        self.turn_broadcast = TurnBroadcast()
+        self.run_players_inline = (
+            self.config.fast_ai and not self.config.use_human_player
+        )
         self.cards_drawn = []
         self.player_card_up_piles = []
         self.player_card_down_piles = []
 
         logging.info("Creating player workers...")
+        players = []
         for i in range(self.config.num_players):
             if i == 0 and self.config.use_human_player:
-                player = HumanPlayer(i, self.snap_queue)
+                player = HumanPlayer(i, self.snap_arbiter, self.turn_broadcast)
             else:
-                player = ComputerPlayer(i, self.snap_queue)
+                player = ComputerPlayer(i, self.snap_arbiter, self.turn_broadcast)
                 if self.config.fast_ai:
                     player.reaction_time_min = 0.0
-                    player.reaction_time_max = 0.001
-            player.thread = threading.Thread(daemon=True, target=player.run)
-            player.thread.start()
-            self.players.append(player)
+                    player.reaction_time_max = INSTANT_REACTION_TIME
+            if not self.run_players_inline:
+                player.thread = threading.Thread(daemon=True, target=player.run)
+                player.thread.start()
+            players.append(player)
+        self.players = players
 
         logging.info("Shuffling the deck...")
-        dealer_cards = sum(
-            (CardStack.new_full_deck() for _ in range(self.config.num_decks)),
-            start=CardStack(),
-        )
+        dealer_cards = CardStack.new_full_deck(self.config.num_decks)
         dealer_cards.shuffle()
         logging.debug("%s", dealer_cards)
 
@@ -291,29 +394,29 @@ class SnapSimulator:
         self.player_card_up_piles = [
             CardStack() for _ in range(self.config.num_players)
         ]
-        self.player_card_down_piles = [
-            CardStack() for _ in range(self.config.num_players)
-        ]
-
-        # Now deal the cards
-        for i, card in enumerate(dealer_cards):
-            self.player_card_down_piles[i % self.config.num_players].push(card)
+        self.player_card_down_piles = dealer_cards.deal(self.config.num_players)
 
         for i, stack in enumerate(self.player_card_down_piles):
             logging.debug("Player %d cards: %s", i, stack)
 
-    def players_still_in_game(self) -> List[Player]:
+    def players_still_in_game(self) -> Tuple[Player, ...]:
         """
-        Return a list of all the players still in the game.
+        Return all the players still in the game.
         """
-        return [player for player in self.players if player.still_in_game]
+        return self._players_still_in
+
+    def num_players_still_in_game(self) -> int:
+        """
+        Return the number of players still in the game.
+        """
+        return len(self._player_indices_still_in)
 
     def cleanup_workers(self):
         """
         Ensure all player worker threads have finished properly.
         """
+        if self.turn_broadcast is not None:  # Not created until the game starts
+            self.turn_broadcast.publish(END_GAME_MESSAGE)
         for player in self.players:
-            player.turn_queue.put(
-                ServerMessage(message_type=ServerMessageType.END_GAME)
-            )
-            player.thread.join()
+            if player.thread is not None:
+                player.thread.join()
@@ -2,8 +2,49 @@
 Tests for snap.cards
 """
 import unittest
-import copy
-from snap.cards import CardValue, CardSuit, Card, CardStack, find_pair
+from snap.cards import (
+    CardValue,
+    CardSuit,
+    Card,
+    CardStack,
+    card_code,
+    code_value,
+    find_pair,
+    find_value_pair,
+)
+
+
+class TestCard(unittest.TestCase):
+    """
+    Tests for snap.cards.Card
+    """
+
+    def test_ordinals(self):
+        """
+        Cards should know the position of their value within the enum.
+        """
+        card = Card(value=CardValue.KING, suit=CardSuit.HEART)
+        self.assertEqual(card.value_ordinal, 12)
+
+    def test_code(self):
+        """
+        Each card should have its own code, which can be decoded back into its value ordinal.
+        """
+        card = Card(value=CardValue.KING, suit=CardSuit.HEART)
+        self.assertEqual(card.code, card_code(CardValue.KING, CardSuit.HEART))
+        self.assertEqual(code_value(card.code), 12)
+        codes = {card.code for card in CardStack.new_full_deck()}
+        self.assertEqual(codes, set(range(52)))
+
+    def test_equality(self):
+        """
+        Cards with the same value and suit should be equal and hash the same.
+        """
+        card1 = Card(value=CardValue.TEN, suit=CardSuit.CLUB)
+        card2 = Card(value=CardValue.TEN, suit=CardSuit.CLUB)
+        self.assertEqual(card1, card2)
+        self.assertEqual(hash(card1), hash(card2))
+        self.assertNotEqual(card1, Card(value=CardValue.TEN, suit=CardSuit.SPADE))
 
 
 class TestCardStack(unittest.TestCase):
@@ -18,11 +59,135 @@ class TestCardStack(unittest.TestCase):
         cards = CardStack()
         cards.push(Card(value=CardValue.ACE, suit=CardSuit.SPADE))
         self.assertEqual(len(cards), 1)
+        self.assertEqual(cards.size, 1)
 
         card = cards.pop()
         self.assertEqual(len(cards), 0)
+        self.assertEqual(cards.size, 0)
         self.assertEqual(card, Card(value=CardValue.ACE, suit=CardSuit.SPADE))
 
+    def test_from_interned(self):
+        """
+        from_interned should create a stack of the given cards, bottom first.
+        """
+        ace = Card(value=CardValue.ACE, suit=CardSuit.SPADE)
+        two = Card(value=CardValue.TWO, suit=CardSuit.HEART)
+        self.assertEqual(list(CardStack.from_interned(ace, two)), [ace, two])
+        self.assertEqual(len(CardStack.from_interned()), 0)
+
+    def test_value_ordinals(self):
+        """
+        value_ordinals should return the value ordinal of each card, bottom first.
+        """
+        cards = CardStack.from_interned(
+            Card(value=CardValue.KING, suit=CardSuit.SPADE),
+            Card(value=CardValue.ACE, suit=CardSuit.HEART),
+        )
+        self.assertEqual(cards.value_ordinals(), bytes([12, 0]))
+
+    def test_pop_returns_equal_card(self):
+        """
+        Pop should return a card equal to the one pushed, shared between all stacks.
+        """
+        cards1 = CardStack()
+        cards2 = CardStack()
+        cards1.push(Card(value=CardValue.SEVEN, suit=CardSuit.DIAMOND))
+        cards2.push(Card(value=CardValue.SEVEN, suit=CardSuit.DIAMOND))
+        card1 = cards1.pop()
+        card2 = cards2.pop()
+        self.assertEqual(card1, Card(value=CardValue.SEVEN, suit=CardSuit.DIAMOND))
+        self.assertIs(card1, card2)
+
+    def test_peek(self):
+        """
+        Peek should show the top card without removing it.
+        """
+        cards = CardStack()
+        self.assertEqual(cards.peek(), None)
+        cards.push(Card(value=CardValue.ACE, suit=CardSuit.SPADE))
+        cards.push(Card(value=CardValue.KING, suit=CardSuit.HEART))
+        self.assertEqual(cards.peek(), Card(value=CardValue.KING, suit=CardSuit.HEART))
+        self.assertEqual(len(cards), 2)
+
+    def test_add(self):
+        """
+        Adding two stacks should give a stack with the cards of both, in order.
+        """
+        cards1 = CardStack([Card(value=CardValue.ACE, suit=CardSuit.SPADE)])
+        cards2 = CardStack([Card(value=CardValue.TEN, suit=CardSuit.CLUB)])
+        self.assertEqual(
+            list(cards1 + cards2),
+            [
+                Card(value=CardValue.ACE, suit=CardSuit.SPADE),
+                Card(value=CardValue.TEN, suit=CardSuit.CLUB),
+            ],
+        )
+
+    def test_shuffle_small(self):
+        """
+        Shuffle should cope with stacks of zero or one cards.
+        """
+        cards = CardStack()
+        cards.shuffle()
+        self.assertEqual(len(cards), 0)
+
+        cards.push(Card(value=CardValue.ACE, suit=CardSuit.SPADE))
+        cards.shuffle()
+        self.assertEqual(list(cards), [Card(value=CardValue.ACE, suit=CardSuit.SPADE)])
+
+    def test_deal(self):
+        """
+        Deal should share the cards out one at a time between the new stacks.
+        """
+        cards = CardStack(
+            [
+                Card(value=CardValue.ACE, suit=CardSuit.SPADE),
+                Card(value=CardValue.TWO, suit=CardSuit.SPADE),
+                Card(value=CardValue.THREE, suit=CardSuit.SPADE),
+                Card(value=CardValue.FOUR, suit=CardSuit.SPADE),
+                Card(value=CardValue.FIVE, suit=CardSuit.SPADE),
+            ]
+        )
+        stacks = cards.deal(2)
+        self.assertEqual(
+            list(stacks[0]),
+            [
+                Card(value=CardValue.ACE, suit=CardSuit.SPADE),
+                Card(value=CardValue.THREE, suit=CardSuit.SPADE),
+                Card(value=CardValue.FIVE, suit=CardSuit.SPADE),
+            ],
+        )
+        self.assertEqual(
+            list(stacks[1]),
+            [
+                Card(value=CardValue.TWO, suit=CardSuit.SPADE),
+                Card(value=CardValue.FOUR, suit=CardSuit.SPADE),
+            ],
+        )
+        self.assertEqual(len(cards), 5)
+
+    def test_iadd(self):
+        """
+        Adding a stack in place should extend this stack and leave the other unchanged.
+        """
+        cards1 = CardStack([Card(value=CardValue.ACE, suit=CardSuit.SPADE)])
+        cards2 = CardStack([Card(value=CardValue.TEN, suit=CardSuit.CLUB)])
+        original_cards1 = cards1
+        cards1 += cards2
+        self.assertIs(cards1, original_cards1)
+        self.assertEqual(len(cards1), 2)
+        self.assertEqual(cards1.peek(), Card(value=CardValue.TEN, suit=CardSuit.CLUB))
+        self.assertEqual(len(cards2), 1)
+
+    def test_clear(self):
+        """
+        Clear should remove all the cards.
+        """
+        cards = CardStack.new_full_deck()
+        cards.clear()
+        self.assertEqual(len(cards), 0)
+        self.assertEqual(cards.peek(), None)
+
     def test_new_full_deck(self):
         """
         Test that new_full_deck includes all possible cards.
@@ -31,15 +196,24 @@ class TestCardStack(unittest.TestCase):
         self.assertEqual(len(cards), 52)
         self.assertEqual(len(set(map(str, cards))), 52)  # all should be unique
 
+    def test_new_full_deck_multiple(self):
+        """
+        Test that new_full_deck can include several decks' worth of cards.
+        """
+        cards = CardStack.new_full_deck(3)
+        self.assertEqual(len(cards), 156)
+        self.assertEqual(len(set(map(str, cards))), 52)
+
     def test_shuffle(self):
         """
         Shuffle should change the order of the deck.
         """
         cards = CardStack.new_full_deck()
-        order1 = copy.deepcopy(cards._cards)  # pylint: disable=protected-access
+        order1 = list(cards)
         cards.shuffle()
-        order2 = cards._cards  # pylint: disable=protected-access
+        order2 = list(cards)
         self.assertNotEqual(order1, order2)
+        self.assertEqual(sorted(map(str, order1)), sorted(map(str, order2)))
 
 
 class TestCardsHelpers(unittest.TestCase):
@@ -51,21 +225,46 @@ class TestCardsHelpers(unittest.TestCase):
         """
         Test that find pair can find a matching pair.
         """
-        cards = {
-            0: Card(value=CardValue.TWO, suit=CardSuit.CLUB),
-            1: Card(value=CardValue.TWO, suit=CardSuit.SPADE),
-        }
-        self.assertEqual(find_pair(cards), [0, 1])
+        cards = [
+            Card(value=CardValue.TWO, suit=CardSuit.CLUB),
+            Card(value=CardValue.TWO, suit=CardSuit.SPADE),
+        ]
+        self.assertEqual(find_pair(cards), (0, 1))
+        self.assertEqual(find_pair(tuple(cards)), (0, 1))
+        self.assertEqual(find_pair(iter(cards)), (0, 1))
 
     def test_find_pair_no_match(self):
         """
         Test that find pair returns None if there is no pair to be found.
         """
-        cards = {
-            0: Card(value=CardValue.TWO, suit=CardSuit.CLUB),
-            1: Card(value=CardValue.THREE, suit=CardSuit.SPADE),
-        }
+        cards = [
+            Card(value=CardValue.TWO, suit=CardSuit.CLUB),
+            Card(value=CardValue.THREE, suit=CardSuit.SPADE),
+        ]
         self.assertEqual(find_pair(cards), None)
+        self.assertEqual(find_pair(tuple(cards)), None)
+        self.assertEqual(find_pair(iter(cards)), None)
+
+    def test_find_pair_first_pair(self):
+        """
+        Test that find pair returns the positions of the first pair found.
+        """
+        cards = [
+            Card(value=CardValue.KING, suit=CardSuit.CLUB),
+            Card(value=CardValue.ACE, suit=CardSuit.SPADE),
+            Card(value=CardValue.ACE, suit=CardSuit.HEART),
+            Card(value=CardValue.KING, suit=CardSuit.DIAMOND),
+        ]
+        self.assertEqual(find_pair(cards), (1, 2))
+        self.assertEqual(find_pair(iter(cards)), (1, 2))
+        self.assertEqual(find_pair(CardStack(cards)), (1, 2))
+
+    def test_find_value_pair(self):
+        """
+        Test that find value pair works directly on value ordinals.
+        """
+        self.assertEqual(find_value_pair(bytes([12, 0, 5, 0])), (1, 3))
+        self.assertEqual(find_value_pair(bytes([12, 0, 5])), None)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,35 @@
 """
 Tests for snap.player
 """
+import queue
+import threading
+import time
 import unittest
-from queue import SimpleQueue
+import unittest.mock
 
+from snap.cards import Card, CardSuit, CardValue
 from snap.player import (
+    ComputerPlayer,
+    END_GAME_MESSAGE,
+    HumanPlayer,
+    INSTANT_REACTION_TIME,
+    Player,
     PlayerMessage,
     PlayerMessageType,
     ServerMessage,
     ServerMessageType,
+    SnapArbiter,
+    TurnBroadcast,
+)
+from tests.utils import (
+    ConsistentSnapPlayer,
+    ConsistentNoSnapPlayer,
+    EMPTY_TURN_MESSAGE,
+    QueuedTurnBroadcast,
+    RecordingSnapArbiter,
+    pop_nolock,
+    push_turns,
 )
-from snap.cards import CardStack
-from tests.utils import ConsistentSnapPlayer, ConsistentNoSnapPlayer
 
 
 class TestPlayer(unittest.TestCase):
@@ -23,33 +41,242 @@ class TestPlayer(unittest.TestCase):
         """
         The player should call SNAP if should_call_snap returns True.
         """
-        snap_queue = SimpleQueue()
-        player = ConsistentSnapPlayer(1, snap_queue)
-        player.turn_queue.put(
-            ServerMessage(message_type=ServerMessageType.TURN, cards=CardStack())
+        snap_arbiter = RecordingSnapArbiter()
+        player = ConsistentSnapPlayer(1, snap_arbiter, QueuedTurnBroadcast())
+        push_turns(
+            player,
+            EMPTY_TURN_MESSAGE,
+            END_GAME_MESSAGE,
         )
-        player.turn_queue.put(ServerMessage(message_type=ServerMessageType.END_GAME))
         player.run()
-        response = snap_queue.get_nowait()
-        self.assertEqual(
-            response, PlayerMessage(player_id=1, message_type=PlayerMessageType.SNAP)
-        )
+        response = pop_nolock(snap_arbiter.responses)
+        self.assertEqual(response.player_id, 1)
+        self.assertIs(response.message_type, PlayerMessageType.SNAP)
 
     def test_no_snap_called(self):
         """
         The player should call NO_SNAP if should_call_snap returns False.
         """
-        snap_queue = SimpleQueue()
-        player = ConsistentNoSnapPlayer(1, snap_queue)
-        player.turn_queue.put(
-            ServerMessage(message_type=ServerMessageType.TURN, cards=CardStack())
+        snap_arbiter = RecordingSnapArbiter()
+        player = ConsistentNoSnapPlayer(1, snap_arbiter, QueuedTurnBroadcast())
+        push_turns(
+            player,
+            EMPTY_TURN_MESSAGE,
+            END_GAME_MESSAGE,
         )
-        player.turn_queue.put(ServerMessage(message_type=ServerMessageType.END_GAME))
         player.run()
-        response = snap_queue.get_nowait()
-        self.assertEqual(
-            response, PlayerMessage(player_id=1, message_type=PlayerMessageType.NO_SNAP)
+        response = pop_nolock(snap_arbiter.responses)
+        self.assertEqual(response.player_id, 1)
+        self.assertIs(response.message_type, PlayerMessageType.NO_SNAP)
+
+    def test_snap_policy_skips_should_call_snap(self):
+        """
+        A player with a fixed SNAP_POLICY should respond without asking should_call_snap.
+        """
+        snap_arbiter = RecordingSnapArbiter()
+        player = ConsistentSnapPlayer(1, snap_arbiter, QueuedTurnBroadcast())
+        push_turns(player, EMPTY_TURN_MESSAGE, END_GAME_MESSAGE)
+        with unittest.mock.patch.object(
+            ConsistentSnapPlayer, "should_call_snap"
+        ) as should_call_snap:
+            player.run()
+        should_call_snap.assert_not_called()
+        self.assertIs(
+            pop_nolock(snap_arbiter.responses).message_type, PlayerMessageType.SNAP
+        )
+
+    def test_run_in_thread(self):
+        """
+        The player should respond to turns published while it runs in its own thread.
+        """
+        snap_arbiter = SnapArbiter()
+        turn_broadcast = TurnBroadcast()
+        player = ConsistentSnapPlayer(1, snap_arbiter, turn_broadcast)
+        thread = threading.Thread(target=player.run)
+        thread.start()
+        snap_arbiter.open_turn(1, 1)
+        turn_broadcast.publish(EMPTY_TURN_MESSAGE)
+        response = snap_arbiter.gather()
+        turn_broadcast.publish(END_GAME_MESSAGE)
+        thread.join()
+        self.assertEqual(response.player_id, 1)
+        self.assertIs(response.message_type, PlayerMessageType.SNAP)
+        self.assertEqual(player.still_in_game, False)
+
+
+class TestComputerPlayer(unittest.TestCase):
+    """
+    Tests for snap.player.ComputerPlayer
+    """
+
+    def test_should_call_snap_instantly(self):
+        """
+        A computer player that never makes mistakes should only call SNAP on a pair.
+        It shouldn't wait at all if its reaction time is instant.
+        """
+        player = ComputerPlayer(0, None, None)
+        player.mistake_chance = 0.0
+        player.miss_chance = 0.0
+        player.reaction_time_min = 0.0
+        player.reaction_time_max = INSTANT_REACTION_TIME
+        pair = (
+            Card(value=CardValue.FIVE, suit=CardSuit.CLUB),
+            Card(value=CardValue.FIVE, suit=CardSuit.HEART),
+        )
+        no_pair = (
+            Card(value=CardValue.FIVE, suit=CardSuit.CLUB),
+            Card(value=CardValue.SIX, suit=CardSuit.HEART),
+        )
+
+        with unittest.mock.patch("time.sleep") as sleep:
+            self.assertEqual(player.should_call_snap(pair), True)
+            self.assertEqual(player.should_call_snap(no_pair), False)
+        sleep.assert_not_called()
+
+
+class TestHumanPlayer(unittest.TestCase):
+    """
+    Tests for snap.player.HumanPlayer
+    """
+
+    @staticmethod
+    def make_human_player(snap_arbiter, turn_broadcast):
+        """
+        Create a HumanPlayer without reading from stdin.
+        Pressing Enter is simulated by putting True on its should_snap_queue.
+        """
+        player = HumanPlayer.__new__(HumanPlayer)
+        Player.__init__(player, 0, snap_arbiter, turn_broadcast)
+        player.should_snap_queue = queue.Queue(maxsize=1)
+        return player
+
+    def test_snap_after_turn_won_by_another_player(self):
+        """
+        An Enter pressed for the next turn shouldn't be used up by a turn another player won.
+        """
+        snap_arbiter = SnapArbiter()
+        turn_broadcast = TurnBroadcast()
+        player = self.make_human_player(snap_arbiter, turn_broadcast)
+        thread = threading.Thread(target=player.run)
+        thread.start()
+
+        # Turn 1: another player calls snap before the human does.
+        snap_arbiter.open_turn(1, 2)
+        turn_broadcast.publish(
+            ServerMessage(message_type=ServerMessageType.TURN, cards=(), turn_number=1)
+        )
+        snap_arbiter.respond(1, PlayerMessage(1, PlayerMessageType.SNAP))
+        self.assertEqual(snap_arbiter.gather().player_id, 1)
+        time.sleep(0.1)  # Let the human start waiting for their turn 1 response.
+
+        # Turn 2: the human presses Enter.
+        snap_arbiter.open_turn(2, 1)
+        player.should_snap_queue.put(True)
+        turn_broadcast.publish(
+            ServerMessage(message_type=ServerMessageType.TURN, cards=(), turn_number=2)
         )
+        start = time.monotonic()
+        response = snap_arbiter.gather()
+        elapsed = time.monotonic() - start
+        turn_broadcast.publish(END_GAME_MESSAGE)
+        thread.join()
+
+        self.assertEqual(response.player_id, 0)
+        self.assertIs(response.message_type, PlayerMessageType.SNAP)
+        self.assertLess(elapsed, 1.0)
+
+
+class TestSnapArbiter(unittest.TestCase):
+    """
+    Tests for snap.player.SnapArbiter
+    """
+
+    def test_first_snap_wins(self):
+        """
+        Only the first SNAP of a turn should be kept.
+        """
+        snap_arbiter = SnapArbiter()
+        snap_arbiter.open_turn(1, 3)
+        snap_arbiter.respond(1, PlayerMessage(0, PlayerMessageType.NO_SNAP))
+        snap_arbiter.respond(1, PlayerMessage(2, PlayerMessageType.SNAP))
+        snap_arbiter.respond(1, PlayerMessage(1, PlayerMessageType.SNAP))
+        response = snap_arbiter.gather()
+        self.assertEqual(response.player_id, 2)
+        self.assertIs(response.message_type, PlayerMessageType.SNAP)
+
+    def test_gather_returns_on_first_snap(self):
+        """
+        Gathering should not wait for the remaining players once someone says SNAP.
+        """
+        snap_arbiter = SnapArbiter()
+        snap_arbiter.open_turn(1, 3)
+        snap_arbiter.respond(1, PlayerMessage(1, PlayerMessageType.SNAP))
+        response = snap_arbiter.gather()
+        self.assertEqual(response.player_id, 1)
+        self.assertIs(response.message_type, PlayerMessageType.SNAP)
+
+    def test_gather_waits_for_all_no_snaps(self):
+        """
+        Gathering should return None once every player has said NO_SNAP.
+        """
+        snap_arbiter = SnapArbiter()
+        snap_arbiter.open_turn(1, 2)
+        snap_arbiter.respond(1, PlayerMessage(0, PlayerMessageType.NO_SNAP))
+        snap_arbiter.respond(1, PlayerMessage(1, PlayerMessageType.NO_SNAP))
+        self.assertIsNone(snap_arbiter.gather())
+
+    def test_late_responses_ignored(self):
+        """
+        Responses to an earlier turn should not count towards the current one.
+        """
+        snap_arbiter = SnapArbiter()
+        snap_arbiter.open_turn(1, 2)
+        snap_arbiter.respond(1, PlayerMessage(0, PlayerMessageType.SNAP))
+        snap_arbiter.gather()
+
+        snap_arbiter.open_turn(2, 1)
+        snap_arbiter.respond(1, PlayerMessage(1, PlayerMessageType.SNAP))
+        snap_arbiter.respond(2, PlayerMessage(0, PlayerMessageType.NO_SNAP))
+        self.assertIsNone(snap_arbiter.gather())
+
+
+class TestTurnBroadcast(unittest.TestCase):
+    """
+    Tests for snap.player.TurnBroadcast
+    """
+
+    def test_wait_returns_latest_message(self):
+        """
+        Waiting should return the latest message once it is newer than the last one seen.
+        """
+        turn_broadcast = TurnBroadcast()
+        player = ConsistentSnapPlayer(0, None, turn_broadcast)
+        turn_broadcast.publish(END_GAME_MESSAGE)
+        self.assertEqual(turn_broadcast.wait(0, player), (1, END_GAME_MESSAGE))
+
+    def test_wait_returns_when_player_out(self):
+        """
+        Waiting should not block once the player is out of the game.
+        """
+        turn_broadcast = TurnBroadcast()
+        player = ConsistentSnapPlayer(0, None, turn_broadcast)
+        player.still_in_game = False
+        self.assertEqual(turn_broadcast.wait(0, player), (0, None))
+
+    def test_player_out_thread_finishes(self):
+        """
+        A player thread should finish without responding once it is marked out.
+        """
+        snap_arbiter = SnapArbiter()
+        turn_broadcast = TurnBroadcast()
+        player = ConsistentSnapPlayer(0, snap_arbiter, turn_broadcast)
+        thread = threading.Thread(target=player.run)
+        thread.start()
+        player.still_in_game = False
+        snap_arbiter.open_turn(1, 0)
+        turn_broadcast.publish(EMPTY_TURN_MESSAGE)
+        thread.join()
+        self.assertIsNone(snap_arbiter.gather())
 
 
 if __name__ == "__main__":
@@ -2,10 +2,24 @@
 Tests for snap.simulator
 """
 import unittest
+import unittest.mock
 
 from snap.simulator import SnapSimulator
 from snap.cards import CardStack, Card, CardSuit, CardValue
-from tests.utils import ConsistentSnapPlayer
+from snap.player import PlayerMessageType
+from tests.utils import (
+    ConsistentSnapPlayer,
+    ConsistentNoSnapPlayer,
+    NullPlayer,
+    assert_pile_sizes,
+)
+
+# One of each card, created once and shared by all the tests (cards are immutable).
+CARDS = {
+    (value, suit): Card(value=value, suit=suit)
+    for value in CardValue
+    for suit in CardSuit
+}
 
 
 class TestSnapSimulator(unittest.TestCase):
@@ -13,34 +27,43 @@ class TestSnapSimulator(unittest.TestCase):
     Tests for snap.simulator.SnapSimulator
     """
 
-    def test_is_game_over_true(self):
-        """
-        Test that is_game_over returns True if the game is over.
-        """
-        sim = SnapSimulator()
-        pile0 = CardStack()
-        pile1 = CardStack([Card(value=CardValue.ACE, suit=CardSuit.SPADE)])
-        sim.player_card_down_piles = [pile0, pile1]
-        self.assertEqual(sim.is_game_over(), True)
+    @classmethod
+    def setUpClass(cls):
+        # Players for tests which never run them or mark them out, so they can be shared.
+        cls.null_players = [NullPlayer(i) for i in range(3)]
 
-    def test_is_game_over_false(self):
+    def test_is_game_over(self):
         """
-        Test that is_game_over returns False if the game is not over.
+        Test that is_game_over returns True only once at most one player has cards left.
         """
+        ace_of_hearts = CARDS[CardValue.ACE, CardSuit.HEART]
+        ace_of_spades = CARDS[CardValue.ACE, CardSuit.SPADE]
+        cases = [
+            ([CardStack(), CardStack.from_interned(ace_of_spades)], True),
+            ([CardStack(), CardStack()], True),
+            (
+                [
+                    CardStack.from_interned(ace_of_hearts),
+                    CardStack.from_interned(ace_of_spades),
+                ],
+                False,
+            ),
+        ]
         sim = SnapSimulator()
-        pile0 = CardStack([Card(value=CardValue.ACE, suit=CardSuit.HEART)])
-        pile1 = CardStack([Card(value=CardValue.ACE, suit=CardSuit.SPADE)])
-        sim.player_card_down_piles = [pile0, pile1]
-        self.assertEqual(sim.is_game_over(), False)
+        sim.player_card_down_piles = []
+        for piles, expected in cases:
+            with self.subTest(piles=piles):
+                sim.player_card_down_piles[:] = piles
+                self.assertEqual(sim.is_game_over(), expected)
 
     def test_get_winning_player_index(self):
         """
         Test that get_winning_player_index returns the correct index.
         """
         sim = SnapSimulator()
-        pile0 = CardStack([])
-        pile1 = CardStack([])
-        pile2 = CardStack([Card(value=CardValue.ACE, suit=CardSuit.SPADE)])
+        pile0 = CardStack()
+        pile1 = CardStack()
+        pile2 = CardStack.from_interned(CARDS[CardValue.ACE, CardSuit.SPADE])
         sim.player_card_down_piles = [pile0, pile1, pile2]
         self.assertEqual(sim.get_winning_player_index(), 2)
 
@@ -50,103 +73,185 @@ class TestSnapSimulator(unittest.TestCase):
         the correct cards.
         """
         sim = SnapSimulator()
-        down_pile0 = CardStack(
-            [
-                Card(value=CardValue.ACE, suit=CardSuit.HEART),
-                Card(value=CardValue.ACE, suit=CardSuit.DIAMOND),
-            ]
+        down_pile0 = CardStack.from_interned(
+            CARDS[CardValue.ACE, CardSuit.HEART],
+            CARDS[CardValue.ACE, CardSuit.DIAMOND],
         )
-        down_pile1 = CardStack(
-            [
-                Card(value=CardValue.ACE, suit=CardSuit.SPADE),
-                Card(value=CardValue.ACE, suit=CardSuit.CLUB),
-            ]
+        down_pile1 = CardStack.from_interned(
+            CARDS[CardValue.ACE, CardSuit.SPADE],
+            CARDS[CardValue.ACE, CardSuit.CLUB],
         )
 
         up_pile0 = CardStack()
-        up_pile1 = CardStack(
-            [
-                Card(value=CardValue.TWO, suit=CardSuit.SPADE),
-            ]
-        )
+        up_pile1 = CardStack.from_interned(CARDS[CardValue.TWO, CardSuit.SPADE])
         sim.player_card_down_piles = [down_pile0, down_pile1]
         sim.player_card_up_piles = [up_pile0, up_pile1]
-        sim.players = [ConsistentSnapPlayer(0, None), ConsistentSnapPlayer(0, None)]
-        cards = sim.turn_over_new_card()
+        sim.players = self.null_players[:2]
+        player_ids, cards = sim.turn_over_new_card()
 
         # It should be player 0's go, so the top card from his down pile should be popped.
-        self.assertEqual(len(down_pile0), 1)
+        self.assertEqual(down_pile0.size, 1)
 
-        # The right cards should be returned
-        self.assertEqual(len(cards), 1)
-        self.assertEqual(cards[0], Card(value=CardValue.ACE, suit=CardSuit.DIAMOND))
+        # The right cards should be returned, along with who drew them
+        self.assertEqual(player_ids, (0,))
+        self.assertEqual(cards, (CARDS[CardValue.ACE, CardSuit.DIAMOND],))
 
-    def test_resolve_snap_decision_when_snap_exists(self):
+        # On the next turn the previous card is returned too
+        sim.turn_count = 1
+        player_ids, cards = sim.turn_over_new_card()
+        self.assertEqual(player_ids, (0, 1))
+        self.assertEqual(
+            cards,
+            (
+                CARDS[CardValue.ACE, CardSuit.DIAMOND],
+                CARDS[CardValue.ACE, CardSuit.CLUB],
+            ),
+        )
+
+    def test_turn_over_new_cards_same_player_twice(self):
         """
-        Test that resolve_snap_decision adds cards to a player's pile if a snap exists.
+        Test that turn_over_new_cards doesn't return the previous card if the same player drew it.
         """
         sim = SnapSimulator()
-        cards = {
-            0: Card(value=CardValue.TWO, suit=CardSuit.HEART),
-            1: Card(value=CardValue.TWO, suit=CardSuit.CLUB),
-            2: Card(value=CardValue.THREE, suit=CardSuit.CLUB),
-        }
-        sim.player_card_up_piles = [
-            CardStack([Card(value=CardValue.TWO, suit=CardSuit.HEART)]),
-            CardStack([Card(value=CardValue.TWO, suit=CardSuit.CLUB)]),
-            CardStack([Card(value=CardValue.THREE, suit=CardSuit.CLUB)]),
+        sim.player_card_down_piles = [
+            CardStack.from_interned(
+                CARDS[CardValue.ACE, CardSuit.HEART],
+                CARDS[CardValue.ACE, CardSuit.DIAMOND],
+            ),
+            CardStack(),
         ]
-        sim.player_card_down_piles = [CardStack(), CardStack(), CardStack()]
-        sim.resolve_snap_decision(cards, 2)
+        sim.player_card_up_piles = [CardStack(), CardStack()]
+        sim.players = [NullPlayer(0), NullPlayer(1)]
+        sim.mark_player_out(1)
+        sim.turn_over_new_card()
+        player_ids, cards = sim.turn_over_new_card()
+        self.assertEqual(player_ids, (0,))
+        self.assertEqual(cards, (CARDS[CardValue.ACE, CardSuit.HEART],))
 
-        # It should clear the relevant card up piles
-        self.assertEqual(len(sim.player_card_up_piles[0]), 0)
-        self.assertEqual(len(sim.player_card_up_piles[1]), 0)
-        self.assertEqual(len(sim.player_card_up_piles[2]), 1)
+    def test_resolve_snap_decision_when_snap_exists(self):
+        """
+        Test that resolve_snap_decision gives the snapped up piles to the calling player.
+        Only the players who drew the given cards are considered when looking for the pair.
+        """
+        two_of_hearts = CARDS[CardValue.TWO, CardSuit.HEART]
+        two_of_clubs = CARDS[CardValue.TWO, CardSuit.CLUB]
+        two_of_spades = CARDS[CardValue.TWO, CardSuit.SPADE]
+        three_of_clubs = CARDS[CardValue.THREE, CardSuit.CLUB]
+        cases = [
+            # (player IDs, cards, top up cards, calling player,
+            #  up pile sizes after, down pile sizes after)
+            (
+                (0, 1, 2),
+                (two_of_hearts, two_of_clubs, three_of_clubs),
+                [two_of_hearts, two_of_clubs, three_of_clubs],
+                2,
+                [0, 0, 1],
+                [0, 0, 2],
+            ),
+            (
+                (0, 2),
+                (two_of_hearts, two_of_clubs),
+                [two_of_hearts, two_of_spades, two_of_clubs],
+                1,
+                [0, 1, 0],
+                [0, 2, 0],
+            ),
+        ]
+        sim = SnapSimulator()
+        sim.player_card_up_piles = []
+        sim.player_card_down_piles = []
+        for player_ids, cards, up_cards, player_id, up_sizes, down_sizes in cases:
+            with self.subTest(player_ids=player_ids, player_id=player_id):
+                sim.player_card_up_piles[:] = [
+                    CardStack.from_interned(card) for card in up_cards
+                ]
+                sim.player_card_down_piles[:] = [CardStack() for _ in up_cards]
+                sim.resolve_snap_decision(player_ids, cards, player_id)
 
-        # It should add the cards to player 2's card down pile
-        self.assertEqual(len(sim.player_card_down_piles[0]), 0)
-        self.assertEqual(len(sim.player_card_down_piles[1]), 0)
-        self.assertEqual(len(sim.player_card_down_piles[2]), 2)
+                assert_pile_sizes(self, sim, down=down_sizes, up=up_sizes)
 
     def test_resolve_snap_decision_when_no_snap_exists(self):
         """
         Test that resolve_snap_decision punishes the calling player if no snap exists.
         """
         sim = SnapSimulator()
-        sim.players = [
-            ConsistentSnapPlayer(0, None),
-            ConsistentSnapPlayer(1, None),
-            ConsistentSnapPlayer(2, None),
-        ]
-        cards = {
-            0: Card(value=CardValue.TWO, suit=CardSuit.HEART),
-            1: Card(value=CardValue.THREE, suit=CardSuit.CLUB),
-            2: Card(value=CardValue.FOUR, suit=CardSuit.CLUB),
-        }
+        sim.players = self.null_players
+        cards = (
+            CARDS[CardValue.TWO, CardSuit.HEART],
+            CARDS[CardValue.THREE, CardSuit.CLUB],
+            CARDS[CardValue.FOUR, CardSuit.CLUB],
+        )
         sim.player_card_up_piles = [
-            CardStack([Card(value=CardValue.TWO, suit=CardSuit.HEART)]),
-            CardStack([Card(value=CardValue.THREE, suit=CardSuit.CLUB)]),
-            CardStack([Card(value=CardValue.FOUR, suit=CardSuit.CLUB)]),
+            CardStack.from_interned(CARDS[CardValue.TWO, CardSuit.HEART]),
+            CardStack.from_interned(CARDS[CardValue.THREE, CardSuit.CLUB]),
+            CardStack.from_interned(CARDS[CardValue.FOUR, CardSuit.CLUB]),
         ]
         sim.player_card_down_piles = [
             CardStack(),
             CardStack(),
-            CardStack([Card(value=CardValue.ACE, suit=CardSuit.SPADE)]),
+            CardStack.from_interned(CARDS[CardValue.ACE, CardSuit.SPADE]),
         ]
-        sim.resolve_snap_decision(cards, 2)
+        sim.resolve_snap_decision((0, 1, 2), cards, 2)
 
         # It should not clear the relevant card up piles
-        self.assertEqual(len(sim.player_card_up_piles[0]), 1)
-        self.assertEqual(len(sim.player_card_up_piles[1]), 1)
-        self.assertEqual(len(sim.player_card_up_piles[2]), 1)
+        assert_pile_sizes(self, sim, up=[1, 1, 1])
 
         # It should remove 1 card from player 2's down pile and give to another player.
-        self.assertEqual(len(sim.player_card_down_piles[2]), 0)
+        self.assertEqual(sim.player_card_down_piles[2].size, 0)
         self.assertEqual(
-            len(sim.player_card_down_piles[0]) + len(sim.player_card_down_piles[1]), 1
+            sim.player_card_down_piles[0].size + sim.player_card_down_piles[1].size, 1
         )
 
+    def test_gather_responses_inline(self):
+        """
+        Test that gather_responses asks inline players directly and returns the first SNAP.
+        """
+        sim = SnapSimulator()
+        sim.run_players_inline = True
+        sim.players = [
+            ConsistentNoSnapPlayer(0, None, None),
+            ConsistentSnapPlayer(1, None, None),
+            ConsistentNoSnapPlayer(2, None, None),
+        ]
+        cards = (CARDS[CardValue.TWO, CardSuit.HEART],)
+        # The players' fixed SNAP_POLICY should be used, as it is when they run in threads.
+        with unittest.mock.patch.object(
+            ConsistentSnapPlayer, "should_call_snap"
+        ) as should_call_snap:
+            response = sim.gather_responses(cards)
+        should_call_snap.assert_not_called()
+        self.assertEqual(response.player_id, 1)
+        self.assertIs(response.message_type, PlayerMessageType.SNAP)
+
+        sim.mark_player_out(1)
+        self.assertIsNone(sim.gather_responses(cards))
+
+    def test_players_still_in_game(self):
+        """
+        Test that players marked out are no longer counted as still in the game.
+        """
+        sim = SnapSimulator()
+        sim.players = [
+            ConsistentSnapPlayer(0, None, None),
+            ConsistentSnapPlayer(1, None, None),
+            ConsistentSnapPlayer(2, None, None),
+        ]
+        sim.mark_player_out(1)
+        self.assertEqual(sim.num_players_still_in_game(), 2)
+        self.assertEqual(sim.players_still_in_game(), (sim.players[0], sim.players[2]))
+        self.assertEqual(sim.players[1].still_in_game, False)
+
+        sim.turn_count = 1
+        self.assertEqual(sim.get_player_id_to_play_next(), 2)
+
+    def test_cleanup_workers_before_start(self):
+        """
+        Test that cleanup_workers does nothing if the game was never started.
+        """
+        sim = SnapSimulator()
+        sim.cleanup_workers()
+        self.assertIsNone(sim.turn_broadcast)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,14 @@
 """
 Utility functions for tests.
 """
-from snap.player import Player
+from collections import deque
+
+from snap.player import Player, ServerMessage, ServerMessageType
+
+# The first turn of a game, with no cards turned over. Messages are immutable, so it's shared.
+EMPTY_TURN_MESSAGE = ServerMessage(
+    message_type=ServerMessageType.TURN, cards=(), turn_number=1
+)
 
 
 class ConsistentSnapPlayer(Player):
@@ -9,6 +16,9 @@ class ConsistentSnapPlayer(Player):
     A player that always calls SNAP at every opportunity.
     """
 
+    __slots__ = ()
+    SNAP_POLICY = True
+
     def should_call_snap(self, cards) -> bool:
         return True
 
@@ -18,5 +28,80 @@ class ConsistentNoSnapPlayer(Player):
     A player that never calls SNAP.
     """
 
+    __slots__ = ()
+    SNAP_POLICY = False
+
     def should_call_snap(self, cards) -> bool:
         return False
+
+
+class NullPlayer(Player):
+    """
+    A player that only ever sits in SnapSimulator.players and is never run.
+    It has no snap_arbiter or turn_broadcast, so it skips Player.__init__, and no __dict__.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, player_id):  # pylint: disable=super-init-not-called
+        self.player_id = player_id
+        self.still_in_game = True
+        self.thread = None
+
+    def should_call_snap(self, cards) -> bool:
+        return False
+
+
+class QueuedTurnBroadcast:  # pylint: disable=too-few-public-methods
+    """
+    A stand-in for snap.player.TurnBroadcast, for running a player in the test's own thread.
+    The messages are queued up front and handed out in order, without any locking.
+    """
+
+    def __init__(self, *messages):
+        self.messages = deque(messages)
+        self.turn_number = 0
+
+    def wait(self, last_turn_number, player):  # pylint: disable=unused-argument
+        """Return the next queued message."""
+        self.turn_number += 1
+        return self.turn_number, self.messages.popleft()
+
+
+class RecordingSnapArbiter:  # pylint: disable=too-few-public-methods
+    """
+    A stand-in for snap.player.SnapArbiter that records every response, without any locking.
+    """
+
+    def __init__(self):
+        self.responses = deque()
+
+    def respond(self, turn_number, message):  # pylint: disable=unused-argument
+        """Record the response."""
+        self.responses.append(message)
+
+
+def push_turns(player, *messages):
+    """
+    Queue up messages for a player whose turn_broadcast is a QueuedTurnBroadcast.
+    """
+    player.turn_broadcast.messages.extend(messages)
+
+
+def pop_nolock(messages):
+    """
+    Take the oldest message from a deque used by a stand-in (e.g. RecordingSnapArbiter.responses).
+    The stand-ins are only used from the test's own thread, so this doesn't lock anything.
+    """
+    return messages.popleft()
+
+
+def assert_pile_sizes(test_case, sim, down=None, up=None):
+    """
+    Assert the number of cards in each player's down and/or up piles in a SnapSimulator.
+    The sizes are compared as whole lists, so a failure shows every pile at once.
+    """
+    if down is not None:
+        test_case.assertEqual([pile.size for pile in sim.player_card_down_piles], down)
+    if up is not None:
+        test_case.assertEqual([pile.size for pile in sim.player_card_up_piles], up)